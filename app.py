@@ -2,16 +2,14 @@ import streamlit as st # 导入 Streamlit 库, 用于创建Web应用
 import pandas as pd     # 导入 Pandas 库, 用于数据处理和分析 (DataFrame)
 from datetime import date, datetime # 导入日期和时间处理模块
 import os               # 导入 OS 模块, 用于操作系统交互, 如文件路径操作
-import io               # 导入 IO 模块, 用于处理流数据, 如将图表保存到内存
-import base64           # 导入 base64 模块, 用于编码/解码数据, 以便在HTML中嵌入图片
 import json             # 导入 json 模块, 用于将字典转换为JSON字符串
+from concurrent.futures import ThreadPoolExecutor # 导入线程池, 用于在后台执行报告保存等磁盘I/O
+import matplotlib       # 导入 matplotlib, 在导入 pyplot 之前选择后端
+matplotlib.use('Agg')   # Web应用不需要弹出窗口, 使用非交互式的 Agg 后端直接渲染到内存
 
-# Import project modules (导入项目内部模块)
-from data.fetcher import fetch_data                 # 从 data.fetcher 导入 fetch_data 函数, 用于获取股票数据
-from data.database import save_report_to_db         # 从 data.database 导入 save_report_to_db 函数
-from strategies.sma_crossover import generate_signals # 从 strategies.sma_crossover 导入 generate_signals 函数, 用于生成交易信号
-from backtest.engine import run_backtest             # 从 backtest.engine 导入 run_backtest 函数, 用于执行回测引擎
-from main import plot_results                       # 从 main 导入 plot_results 函数, 复用其绘图功能
+# Project modules are imported lazily inside the functions/branch that use them,
+# so widget-only reruns don't pay for loading yfinance, pandas_ta and the LLM client.
+# (项目内部模块采用延迟导入, 只在真正运行回测时才加载)
 
 # --- Page Configuration (页面配置) ---
 st.set_page_config(
@@ -20,72 +18,157 @@ st.set_page_config(
     layout="wide" # 页面布局为宽屏模式
 )
 
+# --- Cached Helpers (缓存辅助函数) ---
+# 参数相同的重复点击直接从 Streamlit 内存缓存返回, 避免每次都重新读取数据库/请求网络
+@st.cache_data(ttl=3600, show_spinner=False)
+def _cached_fetch(ticker: str, start: str, end: str):
+    from data.fetcher import fetch_data # 延迟导入: 从 data.fetcher 导入 fetch_data 函数, 用于获取股票数据
+    stock_data, company_name = fetch_data(ticker, start, end)
+    # 价格保持 float64: 均线和回测内核本身就按 float64 计算, 结果与 main.py 完全一致
+    # 确保日期索引按时间升序排列, 滚动窗口计算依赖这一点
+    if not stock_data.empty and not stock_data.index.is_monotonic_increasing:
+        stock_data = stock_data.sort_index()
+    return stock_data, company_name
+
+# 用 pd.util.hash_pandas_object 对价格数据做哈希, 比序列化整个 DataFrame 更快
+_df_hash_funcs = {pd.DataFrame: lambda df: pd.util.hash_pandas_object(df, index=True).values.tobytes()}
+
+class _UncachedResult(Exception):
+    """
+    Carries a result out of a cached function without caching it (Streamlit never caches a call that raises).
+    """
+    def __init__(self, value):
+        super().__init__()
+        self.value = value
+
+# 信号缓存一小时过期; 如果有新闻头条因 Gemini 不可用/解析失败而按 Neutral 处理, 则不缓存该结果, 下次重新分析
+@st.cache_data(ttl=3600, show_spinner=False, hash_funcs=_df_hash_funcs)
+def _cached_signals_inner(stock_data: pd.DataFrame, short_window: int, long_window: int, adx_threshold: int):
+    from strategies.sma_crossover import generate_signals # 延迟导入: 用于生成交易信号
+    signals_data = generate_signals(stock_data, short_window=short_window, long_window=long_window, adx_threshold=adx_threshold)
+    if signals_data.attrs.get('sentiment_fallback'):
+        raise _UncachedResult(signals_data)
+    return signals_data
+
+def _cached_signals(stock_data: pd.DataFrame, short_window: int, long_window: int, adx_threshold: int):
+    try:
+        return _cached_signals_inner(stock_data, short_window, long_window, adx_threshold)
+    except _UncachedResult as uncached:
+        return uncached.value
+
+@st.cache_data(show_spinner=False, hash_funcs=_df_hash_funcs)
+def _cached_backtest(signals_data: pd.DataFrame, initial_capital: float):
+    from backtest.engine import run_backtest # 延迟导入: 用于执行回测引擎
+    return run_backtest(signals_data, initial_capital=initial_capital)
+
+# 缓存编码后的 PNG 字节而不是 Figure 对象: 图表在渲染函数内部编码后立即关闭, 缓存中不会积累 Figure 对象
+@st.cache_data(show_spinner=False, hash_funcs=_df_hash_funcs)
+def _cached_chart_png(portfolio: pd.DataFrame, signals_data: pd.DataFrame, ticker: str, company_name: str) -> bytes:
+    from main import render_results_png # 延迟导入: 复用 main.py 的绘图功能
+    return render_results_png(portfolio, signals_data, ticker, company_name)
+
+# 整个应用共享一个后台I/O线程池, 报告写入数据库时不会阻塞页面渲染
+# 只用一个工作线程: SQLite 同一时间只允许一个写入者, 这个线程也能一直复用自己的数据库连接
+@st.cache_resource
+def _get_io_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-io")
+
+def _log_save_failure(future):
+    if future.exception() is not None:
+        from logger_config import log
+        log.error("Background report save failed: %s", future.exception())
+
+# --- Metric Display Config (性能指标显示配置) ---
+# (标签, stats 中的键, 格式字符串), 在模块加载时定义一次, 每次回测直接复用
+_METRIC_ROWS = [
+    [
+        ("最终资产 (Final Value)", "final_portfolio_value", "${:,.2f}"),
+        ("总收益率 (Total Return)", "total_return_pct", "{:.2f}%"),
+        ("夏普比率 (Sharpe Ratio)", "sharpe_ratio", "{:.2f}"),
+        ("最大回撤 (Max Drawdown)", "max_drawdown_pct", "{:.2f}%"),
+    ],
+    [
+        ("总交易次数 (Total Trades)", "total_trades", "{}"),
+        ("胜率 (Win Rate)", "win_rate_pct", "{:.2f}%"),
+        ("盈亏比 (P/L Ratio)", "profit_loss_ratio", "{:.2f}"),
+    ],
+]
+
 # --- Sidebar for Inputs (侧边栏输入区域) ---
 st.sidebar.header("⚙️ 参数配置 (Configuration)") # 侧边栏标题: 参数配置
 
 # Predefined list of popular tickers (预定义的常用股票代码列表)
 popular_tickers = ["AAPL", "MSFT", "GOOGL", "AMZN", "NVDA", "TSLA", "BRK-B", "JPM", "V", "PG"]
 
-# 股票代码选择框 (Selectbox for Ticker)
-ticker = st.sidebar.selectbox(
-    "股票代码 (Ticker)", # 显示给用户的标签
-    popular_tickers, # 可选列表
-    index=0, # 默认选中第一个 (AAPL)
-    help="""从列表中选择一个股票代码，或在输入框中输入自定义代码。
-          (Select a ticker from the list, or type a custom one in the text input below.)"""
-)
-
-# Optional: Allow user to input a custom ticker if not in the list (or always) (可选: 允许用户输入自定义股票代码)
+# 自定义代码复选框放在表单外, 勾选后输入框可以立即显示
 custom_ticker_option = st.sidebar.checkbox("输入自定义股票代码 (Enter Custom Ticker)", value=False) # 自定义代码复选框
-if custom_ticker_option:
-    custom_ticker = st.sidebar.text_input(
-        "自定义股票代码 (Custom Ticker)", # 自定义代码输入框标签
-        "", # 默认值为空
-        help="""如果您想回测列表中未包含的股票，请在此处输入。""" # 帮助信息
+
+# 使用 st.form 将所有参数输入打包, 只有点击提交按钮时才会触发一次脚本重新运行
+with st.sidebar.form("config"):
+    # 股票代码选择框 (Selectbox for Ticker)
+    ticker = st.selectbox(
+        "股票代码 (Ticker)", # 显示给用户的标签
+        popular_tickers, # 可选列表
+        index=0, # 默认选中第一个 (AAPL)
+        help="""从列表中选择一个股票代码，或在输入框中输入自定义代码。
+              (Select a ticker from the list, or type a custom one in the text input below.)"""
     )
-    if custom_ticker:
-        ticker = custom_ticker # 如果输入了自定义代码, 则更新使用的股票代码
 
-start_date = st.sidebar.date_input(
-    "开始日期 (Start Date)", # 开始日期选择器标签
-    date(2018, 1, 1) # 默认开始日期
-)
+    # Optional: Allow user to input a custom ticker if not in the list (or always) (可选: 允许用户输入自定义股票代码)
+    if custom_ticker_option:
+        custom_ticker = st.text_input(
+            "自定义股票代码 (Custom Ticker)", # 自定义代码输入框标签
+            "", # 默认值为空
+            help="""如果您想回测列表中未包含的股票，请在此处输入。""" # 帮助信息
+        )
+        if custom_ticker:
+            ticker = custom_ticker # 如果输入了自定义代码, 则更新使用的股票代码
 
-end_date = st.sidebar.date_input(
-    "结束日期 (End Date)", # 结束日期选择器标签
-    date(2023, 1, 1) # 默认结束日期
-)
+    start_date = st.date_input(
+        "开始日期 (Start Date)", # 开始日期选择器标签
+        date(2018, 1, 1) # 默认开始日期
+    )
 
-short_window = st.sidebar.number_input(
-    "短期均线窗口 (Short Window)", # 短期均线窗口输入框标签
-    min_value=5, max_value=100, value=40, step=1, # 最小值、最大值、默认值、步长
-    help="用于计算短期简单移动平均线的周期天数。" # 帮助信息
-)
+    end_date = st.date_input(
+        "结束日期 (End Date)", # 结束日期选择器标签
+        date(2023, 1, 1) # 默认结束日期
+    )
 
-long_window = st.sidebar.number_input(
-    "长期均线窗口 (Long Window)", # 长期均线窗口输入框标签
-    min_value=20, max_value=250, value=100, step=1, # 最小值、最大值、默认值、步长
-    help="用于计算长期简单移动平均线的周期天数。" # 帮助信息
-)
+    short_window = st.number_input(
+        "短期均线窗口 (Short Window)", # 短期均线窗口输入框标签
+        min_value=5, max_value=100, value=40, step=1, # 最小值、最大值、默认值、步长
+        help="用于计算短期简单移动平均线的周期天数。" # 帮助信息
+    )
 
-initial_capital = st.sidebar.number_input(
-    "初始资金 (Initial Capital)", # 初始资金输入框标签
-    min_value=1000, max_value=10000000, value=100000, step=1000 # 最小值、最大值、默认值、步长
-)
+    long_window = st.number_input(
+        "长期均线窗口 (Long Window)", # 长期均线窗口输入框标签
+        min_value=20, max_value=250, value=100, step=1, # 最小值、最大值、默认值、步长
+        help="用于计算长期简单移动平均线的周期天数。" # 帮助信息
+    )
 
-adx_threshold = st.sidebar.number_input(
-    "ADX 阈值 (ADX Threshold)", # ADX阈值输入框标签
-    min_value=0, max_value=50, value=25, step=1, # 最小值、最大值、默认值、步长
-    help="""ADX (Average Directional Index) 阈值。当ADX低于此值时，策略不进行交易，以避免盘整市场。
-          (ADX threshold. Strategy avoids trading in sideways markets when ADX is below this value.)"""
-)
+    initial_capital = st.number_input(
+        "初始资金 (Initial Capital)", # 初始资金输入框标签
+        min_value=1000, max_value=10000000, value=100000, step=1000 # 最小值、最大值、默认值、步长
+    )
+
+    adx_threshold = st.number_input(
+        "ADX 阈值 (ADX Threshold)", # ADX阈值输入框标签
+        min_value=0, max_value=50, value=25, step=1, # 最小值、最大值、默认值、步长
+        help="""ADX (Average Directional Index) 阈值。当ADX低于此值时，策略不进行交易，以避免盘整市场。
+              (ADX threshold. Strategy avoids trading in sideways markets when ADX is below this value.)"""
+    )
+
+    submitted = st.form_submit_button("🚀 运行回测 (Run Backtest)") # 表单提交按钮
+
+# 批量回测按钮: 使用表单中最近一次提交的参数, 对所有常用股票代码进行回测
+run_all = st.sidebar.button("📊 回测全部常用股票 (Run All Popular Tickers)")
 
 # --- Main Content (主内容区域) ---
 st.title("📈 量化交易回测平台") # 页面主标题
 st.caption("Quantitative Trading Backtest Platform") # 页面副标题
 
-# 当点击侧边栏的 "运行回测" 按钮时执行以下代码块
-if st.sidebar.button("🚀 运行回测 (Run Backtest)"):
+# 当提交侧边栏表单 ("运行回测" 按钮) 时执行以下代码块
+if submitted:
     # 输入参数验证 (Input Parameter Validation)
     if not ticker:
         st.error("请输入一个股票代码。(Please enter a ticker.)") # 显示错误信息
@@ -96,7 +179,7 @@ if st.sidebar.button("🚀 运行回测 (Run Backtest)"):
         with st.spinner("正在执行回测... (Running backtest..."):
             # 1. Fetch Data (获取数据)
             st.write(f"**1. 获取数据 (Fetching Data) for {ticker}...**")
-            stock_data, company_name = fetch_data(ticker, str(start_date), str(end_date)) # 调用函数获取股票数据
+            stock_data, company_name = _cached_fetch(ticker, str(start_date), str(end_date)) # 调用函数获取股票数据 (带缓存)
 
             if stock_data.empty: # 检查是否成功获取数据
                 st.error("无法获取该股票代码的数据，请检查代码或日期范围。") # 如果数据为空, 显示错误信息
@@ -106,40 +189,31 @@ if st.sidebar.button("🚀 运行回测 (Run Backtest)"):
                 # 2. Generate Signals (with LLM) (生成交易信号 (包含LLM))
                 st.write(f"**2. 生成交易信号 (Generating Signals)...**") # 提示用户正在生成信号
                 # Note: Sentiment analysis logs will print to the console where streamlit is running (注意: 情感分析日志会打印到Streamlit运行的控制台)
-                signals_data = generate_signals(stock_data, short_window=short_window, long_window=long_window, adx_threshold=adx_threshold) # 调用函数生成交易信号
+                signals_data = _cached_signals(stock_data, short_window, long_window, adx_threshold) # 调用函数生成交易信号 (带缓存)
                 st.success("交易信号生成完毕。(Trading signals generated.)") # 显示成功信息
                 
                 # 3. Run Backtest (执行回测模拟)
                 st.write(f"**3. 执行回测模拟 (Running Backtest Simulation)...**") # 提示用户正在执行回测
-                portfolio, stats = run_backtest(signals_data, initial_capital=initial_capital) # 调用函数运行回测
+                portfolio, stats = _cached_backtest(signals_data, initial_capital) # 调用函数运行回测 (带缓存)
                 st.success("回测模拟完成。(Backtest simulation complete.)") # 显示成功信息
 
                 # 4. Display Results (显示结果)
                 st.subheader("📊 回测性能指标 (Backtest Performance Metrics)") # 子标题: 性能指标
                 
                 # Display metrics in two rows (在两行中显示关键指标)
-                col1, col2, col3, col4 = st.columns(4) # 创建4列布局
-                col1.metric("最终资产 (Final Value)", f"${stats['final_portfolio_value']:,.2f}") # 显示最终资产
-                col2.metric("总收益率 (Total Return)", f"{stats['total_return_pct']:.2f}%") # 显示总收益率
-                col3.metric("夏普比率 (Sharpe Ratio)", f"{stats['sharpe_ratio']:.2f}") # 显示夏普比率
-                col4.metric("最大回撤 (Max Drawdown)", f"{stats['max_drawdown_pct']:.2f}%") # 显示最大回撤
-
-                col5, col6, col7, _ = st.columns(4) # 创建4列布局 (忽略第四列)
-                col5.metric("总交易次数 (Total Trades)", f"{stats['total_trades']}") # 显示总交易次数
-                col6.metric("胜率 (Win Rate)", f"{stats['win_rate_pct']:.2f}%") # 显示胜率
-                col7.metric("盈亏比 (P/L Ratio)", f"{stats['profit_loss_ratio']:.2f}") # 显示盈亏比
+                for metric_row in _METRIC_ROWS:
+                    for col, (label, key, fmt) in zip(st.columns(4), metric_row): # 每行创建4列布局
+                        col.metric(label, fmt.format(stats[key]))
 
                 st.subheader("📈 交易图表 (Charts)") # 子标题: 交易图表
-                fig = plot_results(portfolio, signals_data, ticker, company_name) # 调用绘图函数生成图表
-                st.pyplot(fig) # 在Streamlit应用中显示Matplotlib图表
+                # The plot is encoded to PNG exactly once; the same bytes are displayed and stored in the DB (BLOB)
+                # (图表只编码一次 PNG, 页面显示和数据库保存共用同一份字节数据)
+                chart_png = _cached_chart_png(portfolio, signals_data, ticker, company_name) # 调用绘图函数生成图表 (带缓存)
+                st.image(chart_png, use_container_width=True) # 在Streamlit应用中显示图表
 
                 # 5. Save the report to the database (保存报告到数据库)
                 st.write(f"**5. 保存回测报告 (Saving Backtest Report)...**")
-                
-                # Convert plot to a base64 string for DB storage
-                buf = io.BytesIO()
-                fig.savefig(buf, format='png', bbox_inches='tight')
-                chart_image_str = base64.b64encode(buf.getvalue()).decode()
+                from data.database import save_report_to_db # 延迟导入: 从 data.database 导入 save_report_to_db 函数
                 
                 # Gather strategy parameters into a dictionary
                 strategy_params = {
@@ -153,9 +227,61 @@ if st.sidebar.button("🚀 运行回测 (Run Backtest)"):
                 
                 # The 'stats' dictionary is already our performance metrics dict
                 
-                # Save the complete report to the database
-                save_report_to_db(ticker, company_name, strategy_params, stats, chart_image_str)
-                st.success(f"回测报告已成功保存至数据库。(Report successfully saved to database.)")
+                # Save the complete report to the database in the background (在后台线程中保存报告)
+                future = _get_io_pool().submit(save_report_to_db, ticker, company_name, strategy_params, stats, chart_png)
+                future.add_done_callback(_log_save_failure)
+                st.success(f"回测报告正在后台保存至数据库。(Report is being saved to the database in the background.)")
+
+elif run_all:
+    if short_window >= long_window:
+        st.error("短期均线窗口必须小于长期均线窗口。(Short window must be smaller than long window.)") # 显示错误信息
+    else:
+        from logger_config import log # 延迟导入: 记录批量回测中单只股票的失败原因
+        with st.spinner(f"正在批量回测 {len(popular_tickers)} 只股票... (Running {len(popular_tickers)} backtests...)"):
+            # 1. 获取数据是 I/O 密集型任务, 用线程池并发获取所有股票的数据
+            with ThreadPoolExecutor(max_workers=8) as ex:
+                fetch_futures = {t: ex.submit(_cached_fetch, t, str(start_date), str(end_date)) for t in popular_tickers}
+                # 逐个收集结果: 某只股票出错只记录原因, 不会中断整个批量回测
+                fetched, fetch_failed = {}, {}
+                for t, f in fetch_futures.items():
+                    try:
+                        stock_data, company_name = f.result()
+                    except Exception as e:
+                        log.error("Batch fetch failed for %s: %s", t, e)
+                        fetch_failed[t] = str(e)
+                        continue
+                    if stock_data.empty:
+                        fetch_failed[t] = "no data returned"
+                    else:
+                        fetched[t] = (stock_data, company_name)
+
+            # 2. 对成功获取数据的股票, 并发生成信号并执行回测
+            def _signal_and_backtest(stock_data):
+                signals_data = _cached_signals(stock_data, short_window, long_window, adx_threshold)
+                return _cached_backtest(signals_data, initial_capital)[1]
+
+            with ThreadPoolExecutor(max_workers=8) as ex:
+                backtest_futures = {t: ex.submit(_signal_and_backtest, stock_data) for t, (stock_data, _) in fetched.items()}
+                all_stats, backtest_failed = {}, {}
+                for t, f in backtest_futures.items():
+                    try:
+                        all_stats[t] = f.result()
+                    except Exception as e:
+                        log.error("Batch backtest failed for %s: %s", t, e)
+                        backtest_failed[t] = str(e)
+
+        # 3. 以表格形式展示所有股票的回测结果, 并分别列出获取数据失败和回测失败的股票
+        if fetch_failed:
+            st.warning("无法获取以下股票代码的数据 (Could not fetch data for): "
+                       + ", ".join(f"{t} ({reason})" for t, reason in fetch_failed.items()))
+        if backtest_failed:
+            st.warning("以下股票代码回测失败 (Backtest failed for): "
+                       + ", ".join(f"{t} ({reason})" for t, reason in backtest_failed.items()))
+        if all_stats:
+            st.subheader("📊 批量回测结果 (Batch Backtest Results)")
+            results_df = pd.DataFrame.from_dict(all_stats, orient='index')
+            results_df.insert(0, 'company_name', [fetched[t][1] for t in results_df.index])
+            st.dataframe(results_df)
 
 else:
     st.info("请在左侧配置参数并点击 '运行回测'。(Please configure the parameters on the left and click 'Run Backtest'.)") # 默认提示信息，指导用户操作
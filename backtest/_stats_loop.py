@@ -0,0 +1,48 @@
+import numpy as np
+import sys
+import os
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from numba_compat import njit
+
+@njit(cache=True)
+def return_stats(returns: np.ndarray):
+    """
+    Computes the mean, sample standard deviation (ddof=1) and maximum drawdown
+    of a daily returns series in a single pass.
+    The standard deviation uses Welford's algorithm to stay numerically stable.
+
+    Args:
+        returns (np.ndarray): float64 array of daily portfolio returns.
+
+    Returns:
+        tuple[float, float, float]: mean return, standard deviation and max drawdown
+        (as a non-positive fraction).
+    """
+    n = returns.shape[0]
+    mean = 0.0
+    m2 = 0.0
+    equity = 1.0
+    peak = -np.inf
+    max_dd = 0.0
+    for i in range(n):
+        r = returns[i]
+
+        # Running mean and variance
+        delta = r - mean
+        mean += delta / (i + 1)
+        m2 += delta * (r - mean)
+
+        # Cumulative equity, running peak and drawdown
+        equity *= 1.0 + r
+        if equity > peak:
+            peak = equity
+        dd = (equity - peak) / peak
+        if dd < max_dd:
+            max_dd = dd
+
+    std = np.sqrt(m2 / (n - 1)) if n > 1 else np.nan
+    if n == 0:
+        mean = np.nan
+    return mean, std, max_dd
@@ -0,0 +1,45 @@
+import numpy as np
+import sys
+import os
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from numba_compat import njit
+
+@njit(cache=True)
+def pair_trades(pos: np.ndarray, close: np.ndarray):
+    """
+    Pairs entry (+1) and exit (-1) signals into round-trip trades in a single pass.
+    An entry only opens while flat and an exit only closes an open trade,
+    so repeated signals are ignored and an unclosed final entry is dropped.
+
+    Args:
+        pos (np.ndarray): float64 array of position changes (+1, -1, 0 or NaN).
+        close (np.ndarray): float64 array of close prices aligned with `pos`.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: entry indices, exit indices
+        and the fractional profit of each trade.
+    """
+    n = pos.shape[0]
+    entry_idx = np.empty(n, dtype=np.int64)
+    exit_idx = np.empty(n, dtype=np.int64)
+    profits = np.empty(n, dtype=np.float64)
+
+    count = 0
+    in_pos = False
+    entry_i = 0
+    entry_px = 0.0
+    for i in range(n):
+        if pos[i] == 1.0 and not in_pos: # Entry
+            in_pos = True
+            entry_i = i
+            entry_px = close[i]
+        elif pos[i] == -1.0 and in_pos: # Exit
+            entry_idx[count] = entry_i
+            exit_idx[count] = i
+            profits[count] = (close[i] - entry_px) / entry_px
+            count += 1
+            in_pos = False
+
+    return entry_idx[:count], exit_idx[:count], profits[:count]
@@ -1,5 +1,12 @@
 import pandas as pd
 import numpy as np
+import sys
+import os
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backtest._trade_loop import pair_trades
+from backtest._stats_loop import return_stats
 
 def run_backtest(data: pd.DataFrame, initial_capital: float = 100000.0):
     """
@@ -17,77 +24,74 @@ def run_backtest(data: pd.DataFrame, initial_capital: float = 100000.0):
     if 'Close' not in data.columns or 'positions' not in data.columns:
         raise ValueError("Input DataFrame must have 'Close' and 'positions' columns.")
 
-    portfolio = pd.DataFrame(index=data.index)
-    portfolio['close'] = data['Close']
-    portfolio['positions'] = data['positions']
+    # Work on raw float64 arrays and build the portfolio DataFrame once at the end
+    close = data['Close'].to_numpy(dtype=np.float64)
+    pos = data['positions'].to_numpy(dtype=np.float64)
+
+    # Rows without a signal value (the leading NaN from .diff()) are skipped in the
+    # running sums but keep a NaN in the cash column, matching pandas' cumsum(skipna=True)
+    nan_pos = np.isnan(pos)
+    pos_filled = np.where(nan_pos, 0.0, pos)
 
-    # Calculate the number of shares to trade
+    # Calculate the cash change of each trade
     # This is a simplified model: we invest the full capital on a buy signal
-    positions_df = portfolio['positions'].to_frame()
-    positions_df['cash_change'] = -positions_df['positions'] * portfolio['close']
-    
-    # Simulate portfolio holdings
-    portfolio['cash'] = initial_capital + positions_df['cash_change'].cumsum()
+    cash = initial_capital - np.cumsum(pos_filled * close)
+    cash[nan_pos] = np.nan
     
     # Calculate the number of shares held
-    # Note: .ffill() propagates the last valid observation forward
-    portfolio['shares'] = portfolio['positions'].cumsum().ffill()
+    # (carried forward over missing signals; NaN until the first valid one)
+    shares = np.cumsum(pos_filled)
+    shares[np.cumsum(~nan_pos) == 0] = np.nan
     
     # Calculate the market value of the equity holdings
-    portfolio['holdings_value'] = portfolio['shares'] * portfolio['close']
+    holdings_value = shares * close
     
     # Calculate total portfolio value
-    portfolio['total_value'] = portfolio['cash'] + portfolio['holdings_value']
+    total_value = cash + holdings_value
     
     # Calculate portfolio returns
-    portfolio['returns'] = portfolio['total_value'].pct_change().fillna(0)
+    returns = np.zeros_like(total_value)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = total_value[1:] / total_value[:-1] - 1
+    returns[np.isnan(returns)] = 0.0
+
+    portfolio = pd.DataFrame({
+        'close': close,
+        'positions': pos,
+        'cash': cash,
+        'shares': shares,
+        'holdings_value': holdings_value,
+        'total_value': total_value,
+        'returns': returns,
+    }, index=data.index, copy=False)
 
     print("Backtest simulation complete.")
 
     # --- Performance Metrics ---
-    total_return = (portfolio['total_value'].iloc[-1] / initial_capital) - 1
+    total_return = (total_value[-1] / initial_capital) - 1
     
+    # Mean, standard deviation and max drawdown of the returns in one pass (see backtest/_stats_loop.py)
+    mean_return, std_return, max_drawdown = return_stats(np.ascontiguousarray(returns))
+
     # Calculate Sharpe Ratio (assuming risk-free rate is 0)
     # Using a 252-day trading year
-    annualized_return = portfolio['returns'].mean() * 252
-    annualized_std_dev = portfolio['returns'].std() * np.sqrt(252)
+    annualized_return = mean_return * 252
+    annualized_std_dev = std_return * np.sqrt(252)
     sharpe_ratio = annualized_return / annualized_std_dev if annualized_std_dev != 0 else 0
 
-    # Calculate Max Drawdown
-    cumulative_returns = (1 + portfolio['returns']).cumprod()
-    peak = cumulative_returns.cummax()
-    drawdown = (cumulative_returns - peak) / peak
-    max_drawdown = drawdown.min()
-
     # --- Trade Analysis ---
-    positions = portfolio['positions'].loc[portfolio['positions'] != 0]
-    trades = []
-    entry_price = 0
-    entry_date = None
-
-    for date, pos in positions.items():
-        if pos == 1: # Entry
-            if entry_price == 0:
-                entry_price = portfolio.loc[date, 'close']
-                entry_date = date
-        elif pos == -1: # Exit
-            if entry_price != 0:
-                exit_price = portfolio.loc[date, 'close']
-                profit = (exit_price - entry_price) / entry_price
-                trades.append(profit)
-                # Reset for next trade
-                entry_price = 0
-                entry_date = None
+    # Pair entries with exits in a single compiled pass (see backtest/_trade_loop.py)
+    _, _, trades = pair_trades(np.ascontiguousarray(pos), np.ascontiguousarray(close))
     
     total_trades = len(trades)
     if total_trades > 0:
-        winning_trades = [t for t in trades if t > 0]
-        losing_trades = [t for t in trades if t < 0]
+        winning_trades = trades[trades > 0]
+        losing_trades = trades[trades < 0]
         
         win_rate = len(winning_trades) / total_trades if total_trades > 0 else 0
         
-        average_profit = sum(winning_trades) / len(winning_trades) if len(winning_trades) > 0 else 0
-        average_loss = abs(sum(losing_trades) / len(losing_trades)) if len(losing_trades) > 0 else 0
+        average_profit = winning_trades.mean() if len(winning_trades) > 0 else 0
+        average_loss = abs(losing_trades.mean()) if len(losing_trades) > 0 else 0
         profit_loss_ratio = average_profit / average_loss if average_loss > 0 else float('inf')
     else:
         win_rate = 0
@@ -95,7 +99,7 @@ def run_backtest(data: pd.DataFrame, initial_capital: float = 100000.0):
 
     stats = {
         'initial_capital': initial_capital,
-        'final_portfolio_value': portfolio['total_value'].iloc[-1],
+        'final_portfolio_value': total_value[-1],
         'total_return_pct': total_return * 100,
         'annualized_return': annualized_return,
         'annualized_std_dev': annualized_std_dev,
@@ -0,0 +1,59 @@
+import pandas as pd
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from strategies.sma_crossover import generate_signals
+from backtest.engine import run_backtest
+from logger_config import log
+
+# Price data shared by every job in a worker process, set once by the pool initializer
+_DATA: pd.DataFrame | None = None
+
+def _set_data(data: pd.DataFrame):
+    global _DATA
+    _DATA = data
+
+def _run_job(short_window: int, long_window: int, adx_threshold: int, initial_capital: float) -> dict:
+    signals = generate_signals(_DATA, short_window=short_window, long_window=long_window, adx_threshold=adx_threshold)
+    return run_backtest(signals, initial_capital=initial_capital)[1]
+
+def run_sweep(data: pd.DataFrame, grid, adx_threshold: int = 25, initial_capital: float = 100000.0,
+              max_workers: int | None = None) -> pd.DataFrame:
+    """
+    Backtests the SMA crossover strategy for every (short_window, long_window) pair in `grid`,
+    running the combinations in parallel worker processes.
+
+    Args:
+        data (pd.DataFrame): Stock data with 'Open', 'High', 'Low', 'Close' columns.
+        grid: Iterable of (short_window, long_window) pairs. Pairs where the short window
+              is not smaller than the long window are skipped.
+        adx_threshold (int): ADX threshold passed to generate_signals.
+        initial_capital (float): The starting capital for each backtest.
+        max_workers (int | None): Number of worker processes (defaults to the CPU count).
+
+    Returns:
+        pd.DataFrame: One row of performance metrics per pair, indexed by
+                      (short_window, long_window).
+    """
+    pairs = [(s, l) for s, l in grid if s < l]
+    if not pairs:
+        return pd.DataFrame()
+
+    # The price data is sent to each worker once, not pickled again for every job
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_set_data, initargs=(data,)) as ex:
+        futures = {pair: ex.submit(_run_job, pair[0], pair[1], adx_threshold, initial_capital) for pair in pairs}
+        for pair, future in futures.items():
+            try:
+                results[pair] = future.result()
+            except Exception as e:
+                log.error("Sweep job %s failed: %s", pair, e)
+
+    log.info("Parameter sweep completed: %d of %d combinations succeeded.", len(results), len(pairs))
+    sweep_df = pd.DataFrame.from_dict(results, orient='index')
+    if not sweep_df.empty:
+        sweep_df.index = pd.MultiIndex.from_tuples(sweep_df.index, names=['short_window', 'long_window'])
+    return sweep_df
@@ -1,4 +1,7 @@
 import sqlite3
+import threading
+import time
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -10,19 +13,94 @@ from logger_config import log
 
 DB_PATH = 'quant_data.db'
 
+# Price dates are stored as INTEGER days since the Unix epoch (1970-01-01)
+_EPOCH = pd.Timestamp('1970-01-01')
+
+def _to_epoch_days(date_str: str) -> int:
+    """
+    Converts a 'YYYY-MM-DD' date string to the integer day number stored in stock_prices.
+    """
+    return (pd.Timestamp(date_str).normalize() - _EPOCH).days
+
+# One long-lived connection per thread, reused across calls instead of reconnecting every time
+_local = threading.local()
+
+# The schema check/migration runs once per process, when the first connection is opened
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def _get_conn() -> sqlite3.Connection:
+    """
+    Returns the current thread's database connection, opening and configuring it on first use.
+    WAL journaling with synchronous=NORMAL removes the per-commit fsync of the default journal mode.
+    """
+    con = getattr(_local, 'con', None)
+    if con is None:
+        con = sqlite3.connect(DB_PATH)
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA synchronous=NORMAL')
+        con.execute('PRAGMA temp_store=MEMORY')
+        con.execute('PRAGMA cache_size=-65536')
+        _local.con = con
+    if not _schema_ready:
+        _ensure_schema(con)
+    return con
+
+def _ensure_schema(con: sqlite3.Connection):
+    """
+    Creates/migrates the tables the first time any connection is opened in this process,
+    so callers never read or write an old-format database.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            _create_schema(con)
+            _schema_ready = True
+            log.info("Database initialized successfully at '%s'.", DB_PATH)
+        except sqlite3.Error as e:
+            # Left unset, so the next new connection retries
+            log.error("Database initialization error: %s", e)
+
 def init_db():
     """
     Initializes the database and creates tables if they don't exist.
+    This also happens automatically when the first connection is opened.
     """
-    try:
-        con = sqlite3.connect(DB_PATH)
+    _ensure_schema(_get_conn())
+
+def _table_exists(cur: sqlite3.Cursor, name: str) -> bool:
+    return cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def _create_schema(con: sqlite3.Connection):
+    """
+    Creates the tables if they don't exist and migrates older schemas.
+    The whole migration runs in one transaction, so a failure leaves the old tables untouched.
+    """
+    # Python's sqlite3 does not open a transaction for DDL (the RENAME/CREATE/DROP statements),
+    # so begin one explicitly; `with con` then commits it, or rolls everything back on error
+    con.execute('BEGIN IMMEDIATE')
+    with con:
         cur = con.cursor()
-        
+    
+        # Migrate a stock_prices table from TEXT dates to INTEGER epoch days.
+        # A *_text_dates table left behind by an interrupted older migration is merged in as well.
+        date_type = [row[2] for row in cur.execute("PRAGMA table_info(stock_prices)") if row[1] == 'date']
+        leftover_dates = _table_exists(cur, 'stock_prices_text_dates')
+        migrate_dates = bool(date_type) and date_type[0].upper() == 'TEXT' and not leftover_dates
+        if migrate_dates:
+            log.info("Migrating stock_prices dates from TEXT to INTEGER epoch days...")
+            cur.execute("DROP INDEX IF EXISTS idx_prices_cover")
+            cur.execute("ALTER TABLE stock_prices RENAME TO stock_prices_text_dates")
+
         # Create stock_prices table
         cur.execute('''
             CREATE TABLE IF NOT EXISTS stock_prices (
                 ticker TEXT NOT NULL,
-                date TEXT NOT NULL,
+                date INTEGER NOT NULL,
                 open REAL NOT NULL,
                 high REAL NOT NULL,
                 low REAL NOT NULL,
@@ -32,6 +110,27 @@ def init_db():
             )
         ''')
 
+        if migrate_dates or leftover_dates:
+            # Rows whose date can't be parsed are dropped; they are simply re-fetched from yfinance
+            skipped = cur.execute("SELECT COUNT(*) FROM stock_prices_text_dates WHERE julianday(date) IS NULL").fetchone()[0]
+            if skipped:
+                log.warning("Skipping %d price rows with unparseable dates during migration.", skipped)
+            # OR IGNORE: rows already saved in the new format are newer and take precedence
+            cur.execute('''
+                INSERT OR IGNORE INTO stock_prices (ticker, date, open, high, low, close, volume)
+                SELECT ticker, CAST(julianday(date) - 2440587.5 AS INTEGER), open, high, low, close, volume
+                FROM stock_prices_text_dates
+                WHERE julianday(date) IS NOT NULL
+            ''')
+            cur.execute("DROP TABLE stock_prices_text_dates")
+
+        # Covering index for the (ticker, date range) price reads: every selected column is in
+        # the index, so range scans never touch the table rows. Costs roughly 2x storage for prices.
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS idx_prices_cover
+            ON stock_prices (ticker, date, open, high, low, close, volume)
+        ''')
+
         # Create company_info table
         cur.execute('''
             CREATE TABLE IF NOT EXISTS company_info (
@@ -40,26 +139,53 @@ def init_db():
             )
         ''')
 
+        # Create sentiment_cache table (LLM sentiment labels keyed by a hash of the headline text)
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS sentiment_cache (
+                text_hash TEXT PRIMARY KEY,
+                sentiment TEXT NOT NULL
+            )
+        ''')
+
+        # Migrate a backtest_reports table from TEXT local-time timestamps to INTEGER Unix epoch seconds
+        # A *_text_ts table left behind by an interrupted older migration is merged in as well.
+        ts_type = [row[2] for row in cur.execute("PRAGMA table_info(backtest_reports)") if row[1] == 'run_timestamp']
+        leftover_ts = _table_exists(cur, 'backtest_reports_text_ts')
+        migrate_timestamps = bool(ts_type) and ts_type[0].upper() == 'TEXT' and not leftover_ts
+        if migrate_timestamps:
+            log.info("Migrating backtest_reports timestamps from TEXT to INTEGER epoch seconds...")
+            cur.execute("ALTER TABLE backtest_reports RENAME TO backtest_reports_text_ts")
+
         # Create backtest_reports table
         cur.execute('''
             CREATE TABLE IF NOT EXISTS backtest_reports (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 ticker TEXT NOT NULL,
                 company_name TEXT,
-                run_timestamp TEXT NOT NULL,
+                run_timestamp INTEGER NOT NULL,
                 strategy_params TEXT NOT NULL,
                 performance_metrics TEXT NOT NULL,
-                chart_image TEXT NOT NULL
+                chart_image BLOB NOT NULL
             )
         ''')
-        
-        con.commit()
-        log.info(f"Database initialized successfully at '{DB_PATH}'.")
-    except sqlite3.Error as e:
-        log.error(f"Database initialization error: {e}")
-    finally:
-        if con:
-            con.close()
+
+        if migrate_timestamps or leftover_ts:
+            # Reports with an unparseable timestamp are kept, dated at the epoch (and so listed last)
+            unparsed = cur.execute(
+                "SELECT COUNT(*) FROM backtest_reports_text_ts WHERE strftime('%s', run_timestamp, 'utc') IS NULL"
+            ).fetchone()[0]
+            if unparsed:
+                log.warning("%d reports have unparseable timestamps; storing them with timestamp 0.", unparsed)
+            # Ids are kept on a normal migration; leftover reports are merged into the newer ones, so they get new ids
+            id_col = "" if leftover_ts else "id, "
+            # The old text was local time; the 'utc' modifier converts it to UTC before taking '%s'
+            cur.execute(f'''
+                INSERT INTO backtest_reports ({id_col}ticker, company_name, run_timestamp, strategy_params, performance_metrics, chart_image)
+                SELECT {id_col}ticker, company_name, COALESCE(CAST(strftime('%s', run_timestamp, 'utc') AS INTEGER), 0),
+                       strategy_params, performance_metrics, chart_image
+                FROM backtest_reports_text_ts
+            ''')
+            cur.execute("DROP TABLE backtest_reports_text_ts")
 
 def save_prices_to_db(ticker: str, data: pd.DataFrame):
     """
@@ -69,126 +195,187 @@ def save_prices_to_db(ticker: str, data: pd.DataFrame):
         return
         
     try:
-        con = sqlite3.connect(DB_PATH)
-        df_to_save = data.copy()
-        df_to_save['ticker'] = ticker
-        
-        df_to_save.rename(columns={
-            'Open': 'open', 'High': 'high', 'Low': 'low', 
-            'Close': 'close', 'Volume': 'volume'
-        }, inplace=True)
-        
-        df_to_save.index.name = 'date'
-        df_to_save.reset_index(inplace=True)
-        
-        columns_to_save = ['ticker', 'date', 'open', 'high', 'low', 'close', 'volume']
-        df_to_save = df_to_save[columns_to_save]
-        
-        df_to_save.to_sql('stock_prices', con, if_exists='append', index=False)
-        log.info(f"Saved {len(df_to_save)} rows of price data for {ticker} to the database.")
+        con = _get_conn()
+
+        # Build plain Python rows straight from the columns (no DataFrame copy / reset_index),
+        # with dates as integer days since the epoch
+        dates = data.index.values.astype('datetime64[D]').astype(np.int64).tolist()
+        rows = list(zip(
+            [ticker] * len(data), dates,
+            data['Open'].tolist(), data['High'].tolist(), data['Low'].tolist(),
+            data['Close'].tolist(), data['Volume'].astype('int64').tolist()
+        ))
+
+        # INSERT OR REPLACE makes overlapping re-fetches update rows instead of violating the primary key
+        with con: # Commits on success, rolls back on error
+            con.executemany(
+                "INSERT OR REPLACE INTO stock_prices (ticker, date, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        # Refresh planner statistics after the bulk load so range reads keep using the covering index
+        con.execute('PRAGMA optimize')
+        log.info("Saved %d rows of price data for %s to the database.", len(rows), ticker)
     except Exception as e:
-        log.error(f"Error saving price data for {ticker} to database: {e}")
-    finally:
-        if con:
-            con.close()
+        log.error("Error saving price data for %s to database: %s", ticker, e)
 
 def get_prices_from_db(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
     """
     Retrieves stock prices from the database for a given ticker and date range.
     """
     try:
-        con = sqlite3.connect(DB_PATH)
-        query = f"""
-            SELECT date, open, high, low, close, volume 
+        con = _get_conn()
+        # Column aliases and parse_dates/index_col let pandas return the final frame directly
+        query = """
+            SELECT date, open AS Open, high AS High, low AS Low, close AS Close, volume AS Volume
             FROM stock_prices 
-            WHERE ticker = ? AND date BETWEEN ? AND ?
+            WHERE ticker = ? AND date >= ? AND date < ?
         """
-        df = pd.read_sql_query(query, con, params=(ticker, start_date, end_date))
+        # The end date is exclusive, as with yfinance's history(end=...)
+        params = (ticker, _to_epoch_days(start_date), _to_epoch_days(end_date))
+        df = pd.read_sql_query(query, con, params=params, parse_dates={'date': {'unit': 'D'}}, index_col='date')
         
         if not df.empty:
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            df.dropna(subset=['date'], inplace=True)
-
-            if pd.api.types.is_datetime64_any_dtype(df['date']) and df['date'].dt.tz is not None:
-                df['date'] = df['date'].dt.tz_localize(None)
-
-            df.set_index('date', inplace=True)
-            if df.index.tz is not None:
-                df.index = df.index.tz_localize(None)
-
-            df.rename(columns={
-                'open': 'Open', 'high': 'High', 'low': 'Low', 
-                'close': 'Close', 'volume': 'Volume'
-            }, inplace=True)
-            log.info(f"Retrieved {len(df)} rows for {ticker} from local database.")
+            log.info("Retrieved %d rows for %s from local database.", len(df), ticker)
         return df
     except Exception as e:
-        log.error(f"Error getting prices for {ticker} from database: {e}")
+        log.error("Error getting prices for %s from database: %s", ticker, e)
         return pd.DataFrame()
-    finally:
-        if con:
-            con.close()
 
-def get_latest_date_from_db(ticker: str) -> str | None:
+def get_latest_date_from_db(ticker: str) -> int | None:
     """
-    Gets the latest date for which data is available for a given ticker.
+    Gets the latest date for which data is available for a given ticker,
+    as integer days since the epoch (convert with pd.to_datetime(value, unit='D')).
     """
     try:
-        con = sqlite3.connect(DB_PATH)
+        con = _get_conn()
         cur = con.cursor()
         cur.execute("SELECT MAX(date) FROM stock_prices WHERE ticker = ?", (ticker,))
         result = cur.fetchone()[0]
         return result
     except Exception as e:
-        log.error(f"Error getting latest date for {ticker}: {e}")
+        log.error("Error getting latest date for %s: %s", ticker, e)
         return None
-    finally:
-        if con:
-            con.close()
 
-def save_report_to_db(ticker: str, company_name: str, params: dict, metrics: dict, chart_image: str):
+def get_company_name_from_db(ticker: str) -> str | None:
+    """
+    Gets the cached company name for a given ticker, or None if it has not been stored yet.
+    """
+    try:
+        con = _get_conn()
+        row = con.execute("SELECT company_name FROM company_info WHERE ticker = ?", (ticker,)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        log.error("Error getting company name for %s: %s", ticker, e)
+        return None
+
+def save_company_name_to_db(ticker: str, company_name: str):
+    """
+    Saves (or updates) the company name for a given ticker.
+    """
+    try:
+        con = _get_conn()
+        with con: # Commits on success, rolls back on error
+            con.execute(
+                "INSERT OR REPLACE INTO company_info (ticker, company_name) VALUES (?, ?)",
+                (ticker, company_name)
+            )
+    except Exception as e:
+        log.error("Error saving company name for %s to database: %s", ticker, e)
+
+def get_sentiment_cache_from_db() -> dict[str, str]:
+    """
+    Retrieves all cached sentiment labels as a {text_hash: sentiment} dictionary.
+    """
+    try:
+        con = _get_conn()
+        return dict(con.execute("SELECT text_hash, sentiment FROM sentiment_cache").fetchall())
+    except Exception as e:
+        log.error("Error getting sentiment cache from database: %s", e)
+        return {}
+
+def save_sentiments_to_db(sentiments: dict[str, str]):
+    """
+    Saves {text_hash: sentiment} entries to the sentiment cache.
+    """
+    if not sentiments:
+        return
+    try:
+        con = _get_conn()
+        with con: # Commits on success, rolls back on error
+            con.executemany(
+                "INSERT OR REPLACE INTO sentiment_cache (text_hash, sentiment) VALUES (?, ?)",
+                sentiments.items()
+            )
+    except Exception as e:
+        log.error("Error saving sentiments to database: %s", e)
+
+def save_report_to_db(ticker: str, company_name: str, params: dict, metrics: dict, chart_image: bytes):
     """
     Saves a complete backtest report to the database.
+    The chart is stored as raw PNG bytes (BLOB) rather than base64 text.
+    Re-running with the same parameters and results does not add a duplicate report.
     """
     try:
-        con = sqlite3.connect(DB_PATH)
-        cur = con.cursor()
-        
-        import json
-        params_json = json.dumps(params)
-        metrics_json = json.dumps(metrics)
-        
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        con = _get_conn()
+        with con: # Commits on success, rolls back on error
+            cur = con.cursor()
         
-        cur.execute('''
-            INSERT INTO backtest_reports (ticker, company_name, run_timestamp, strategy_params, performance_metrics, chart_image)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (ticker, company_name, timestamp, params_json, metrics_json, chart_image))
+            import json
+            # Stored in the dicts' own order, which the Report Viewer tables display as-is
+            params_json = json.dumps(params)
+            metrics_json = json.dumps(metrics)
+
+            # Skip the write (and the chart BLOB) if the latest report for this ticker is identical
+            cur.execute(
+                "SELECT strategy_params, performance_metrics FROM backtest_reports WHERE ticker = ? ORDER BY id DESC LIMIT 1",
+                (ticker,)
+            )
+            # Compared as parsed dicts, so key order (e.g. older sorted-key rows) doesn't matter
+            latest = cur.fetchone()
+            if latest is not None and (json.loads(latest[0]), json.loads(latest[1])) == (json.loads(params_json), json.loads(metrics_json)):
+                log.info("Latest report for %s has identical parameters and metrics. Skipping save.", ticker)
+                return
+
+            timestamp = int(time.time()) # Unix epoch seconds
         
-        con.commit()
-        log.info(f"Successfully saved backtest report for {ticker} to the database.")
+            cur.execute('''
+                INSERT INTO backtest_reports (ticker, company_name, run_timestamp, strategy_params, performance_metrics, chart_image)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (ticker, company_name, timestamp, params_json, metrics_json, chart_image))
+
+        log.info("Successfully saved backtest report for %s to the database.", ticker)
     except Exception as e:
-        log.error(f"Error saving report for {ticker} to database: {e}")
-    finally:
-        if con:
-            con.close()
+        log.error("Error saving report for %s to database: %s", ticker, e)
 
-def get_all_reports_from_db() -> pd.DataFrame:
+def get_report_summaries_from_db() -> pd.DataFrame:
     """
-    Retrieves all backtest reports from the database.
+    Retrieves all backtest reports without their chart images, newest first.
+    Charts are loaded one at a time with get_chart_image_from_db.
     """
     try:
-        con = sqlite3.connect(DB_PATH)
-        query = "SELECT id, ticker, company_name, run_timestamp, strategy_params, performance_metrics, chart_image FROM backtest_reports ORDER BY run_timestamp DESC"
+        con = _get_conn()
+        query = "SELECT id, ticker, company_name, run_timestamp, strategy_params, performance_metrics FROM backtest_reports ORDER BY run_timestamp DESC"
         df = pd.read_sql_query(query, con)
-        log.info(f"Retrieved {len(df)} reports from the database.")
+        # Timestamps are stored as epoch seconds; convert to local-time display strings
+        df['run_timestamp'] = [datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") for ts in df['run_timestamp']]
+        log.info("Retrieved %d report summaries from the database.", len(df))
         return df
     except Exception as e:
-        log.error(f"Error getting reports from database: {e}")
+        log.error("Error getting report summaries from database: %s", e)
         return pd.DataFrame()
-    finally:
-        if con:
-            con.close()
+
+def get_chart_image_from_db(report_id: int) -> bytes | str | None:
+    """
+    Retrieves the chart image of a single backtest report.
+    Returns PNG bytes (or a base64 string for older reports), or None if not found.
+    """
+    try:
+        con = _get_conn()
+        row = con.execute("SELECT chart_image FROM backtest_reports WHERE id = ?", (report_id,)).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        log.error("Error getting chart image for report %s from database: %s", report_id, e)
+        return None
 
 if __name__ == '__main__':
     print("Initializing the database...")
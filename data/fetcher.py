@@ -1,20 +1,62 @@
 import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import time
 import sys
 import os
 
 # Add the project root to the Python path to allow for absolute imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from logger_config import log
-from data.database import get_prices_from_db, save_prices_to_db, get_latest_date_from_db
+from data.database import (
+    get_prices_from_db, save_prices_to_db, get_latest_date_from_db,
+    get_company_name_from_db, save_company_name_to_db
+)
+
+def _is_rate_limited(e: Exception) -> bool:
+    """
+    Returns True if the exception is Yahoo Finance rejecting the request for being rate limited.
+    """
+    return 'RateLimit' in type(e).__name__ or 'Too Many Requests' in str(e)
+
+def _with_backoff(func, *args, retries: int = 4, base_delay: float = 1.0, **kwargs):
+    """
+    Calls func(*args, **kwargs), retrying with exponential backoff (1s, 2s, 4s, ...) while rate limited.
+    Other errors, and the last rate-limit error, are raised to the caller.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not _is_rate_limited(e):
+                raise
+            delay = base_delay * 2 ** attempt
+            log.warning("Rate limited by yfinance (%s). Retrying in %.0fs...", e, delay)
+            time.sleep(delay)
+
+def get_company_name(ticker: str, stock: yf.Ticker | None = None) -> str:
+    """
+    Returns the company name for a ticker, from the local database if available.
+    Only on a cache miss is Yahoo Finance queried, and the result is stored for next time.
+    """
+    company_name = get_company_name_from_db(ticker)
+    if company_name:
+        return company_name
+    try:
+        info = _with_backoff(lambda: (stock or yf.Ticker(ticker)).info)
+        company_name = info.get('longName', ticker)
+    except Exception:
+        return ticker # Default to ticker on error (not cached, so it is retried later)
+    save_company_name_to_db(ticker, company_name)
+    return company_name
 
 def fetch_data(ticker: str, start_date: str, end_date: str) -> tuple[pd.DataFrame, str]:
     """
     Fetches historical stock data and company name, prioritizing the local database.
     If data is missing, it fetches from Yahoo Finance and updates the database.
     """
-    log.info(f"--- Data request for {ticker} from {start_date} to {end_date} ---")
+    log.info("--- Data request for %s from %s to %s ---", ticker, start_date, end_date)
     
     # 1. Try to fetch all data from the database first
     data_from_db = get_prices_from_db(ticker, start_date, end_date)
@@ -31,56 +73,70 @@ def fetch_data(ticker: str, start_date: str, end_date: str) -> tuple[pd.DataFram
             db_is_complete = True
 
     if db_is_complete:
-        log.info(f"Found complete data for {ticker} in the local database.")
-        # We still need the company name, let's fetch it quickly. A better implementation might cache this too.
-        try:
-            company_name = yf.Ticker(ticker).info.get('longName', ticker)
-        except Exception:
-            company_name = ticker # Default to ticker on error
+        log.info("Found complete data for %s in the local database.", ticker)
+        # The company name is cached in the database too, so this path needs no network call
+        company_name = get_company_name(ticker)
         return data_from_db, company_name
 
     # 2. If data is not complete, determine what's missing
     latest_date_in_db = get_latest_date_from_db(ticker)
-    fetch_start_date_str = latest_date_in_db if latest_date_in_db else start_date
-    if latest_date_in_db:
-         # Fetch data from the day after the last recorded date, ensuring tz-naive for conversion
-         fetch_start_date_dt = pd.to_datetime(latest_date_in_db).tz_localize(None) + timedelta(days=1)
+    fetch_start_date_str = start_date
+    if latest_date_in_db is not None:
+         # Fetch data from the day after the last recorded date (stored as days since the epoch)
+         fetch_start_date_dt = pd.to_datetime(latest_date_in_db, unit='D') + timedelta(days=1)
          fetch_start_date_str = fetch_start_date_dt.strftime('%Y-%m-%d')
 
-    log.info(f"Local data for {ticker} is incomplete. Fetching new data from yfinance starting from {fetch_start_date_str}.")
+    log.info("Local data for %s is incomplete. Fetching new data from yfinance starting from %s.", ticker, fetch_start_date_str)
     
     # 3. Fetch new data from yfinance
     try:
         stock = yf.Ticker(ticker)
-        company_name = stock.info.get('longName', ticker)
+        company_name = get_company_name(ticker, stock)
         
         # Fetching a slightly larger range to be safe
-        new_data = stock.history(start=fetch_start_date_str, end=end_date)
+        new_data = _with_backoff(stock.history, start=fetch_start_date_str, end=end_date)
         
         # IMPORTANT: Localize yfinance data index to tz-naive before saving/processing
         if not new_data.empty and new_data.index.tz is not None:
             new_data.index = new_data.index.tz_localize(None)
         
         if new_data.empty:
-            log.warning(f"No new data found for {ticker} from yfinance.")
+            log.warning("No new data found for %s from yfinance.", ticker)
+            final_data = data_from_db
         else:
             # 4. Save the new data to the database
             save_prices_to_db(ticker, new_data)
-            
-        # 5. Retrieve the complete, combined data from the database
-        final_data = get_prices_from_db(ticker, start_date, end_date)
-        # Ensure final data is tz-naive
-        if not final_data.empty and final_data.index.tz is not None:
-            final_data.index = final_data.index.tz_localize(None)
+
+            # 5. Merge the new rows with what was already read from the database, in memory,
+            # instead of re-reading the whole range back from SQLite
+            new_data = new_data[['Open', 'High', 'Low', 'Close', 'Volume']]
+            new_data.index.name = 'date'
+            in_range = (new_data.index >= pd.Timestamp(start_date)) & (new_data.index < pd.Timestamp(end_date))
+            final_data = pd.concat([data_from_db, new_data[in_range]]) if not data_from_db.empty else new_data[in_range]
+            final_data = final_data[~final_data.index.duplicated(keep='last')].sort_index()
 
         log.info("--- Data request fulfilled ---")
         return final_data, company_name
 
     except Exception as e:
-        log.error(f"Error fetching data for {ticker} from yfinance: {e}")
+        log.error("Error fetching data for %s from yfinance: %s", ticker, e)
         log.info("--- Data request fulfilled with error ---")
         return pd.DataFrame(), ticker # Return ticker as name on error
 
+def fetch_many(tickers: list[str], start_date: str, end_date: str, max_workers: int = 16) -> dict[str, tuple[pd.DataFrame, str]]:
+    """
+    Fetches several tickers concurrently with fetch_data.
+    The work is dominated by network latency (the GIL is released during socket reads), so threads
+    give a near-linear speedup. Each worker thread uses its own SQLite connection, and WAL mode lets
+    their writes proceed without blocking readers.
+
+    Returns:
+        dict: Maps each ticker to its (data, company_name) tuple, in the order given.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = {t: ex.submit(fetch_data, t, start_date, end_date) for t in tickers}
+        return {t: f.result() for t, f in futures.items()}
+
 if __name__ == '__main__':
     # Example usage:
     ticker_symbol = 'NVDA' # Using a different ticker to test
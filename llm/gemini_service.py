@@ -1,56 +1,123 @@
 import os
+import hashlib
+import re
+import logging
 import google.generativeai as genai
 from dotenv import load_dotenv
 from logger_config import log # Import the centralized logger
+from data.database import get_sentiment_cache_from_db, save_sentiments_to_db
 
-def get_sentiment(text: str) -> str:
+VALID_SENTIMENTS = frozenset(('Positive', 'Negative', 'Neutral'))
+MODEL_NAME = 'gemini-flash-latest'
+
+# Read the API key and configure the client once at import time, not on every call
+load_dotenv()
+_api_key = os.getenv("GEMINI_API_KEY")
+if _api_key:
+    genai.configure(api_key=_api_key)
+_MODEL = genai.GenerativeModel(MODEL_NAME) if _api_key else None
+
+# In-memory cache of {text_hash: sentiment}, prewarmed from the database on first use
+_sentiment_cache: dict[str, str] | None = None
+
+# Prompt template built once; filled with (count, count, numbered headlines) per request
+_PROMPT_FMT = """
+Analyze the sentiment of each of the following %d financial news headlines.
+Classify each one as 'Positive', 'Negative', or 'Neutral'.
+Return exactly %d lines in the form "<number>. <classification>", using the headline numbers below.
+
+Headlines:
+%s
+"""
+
+# One numbered label per line, e.g. "1. Positive", "2) **Negative**"
+_LABEL_LINE = re.compile(r'^\s*(\d+)[.)]\s*\**(\w+)', re.MULTILINE)
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def _classify_with_gemini(texts: list[str]) -> list[str | None] | None:
     """
-    Analyzes the sentiment of a given text using the Gemini API.
+    Sends the texts to Gemini in a single request.
+    Returns one entry per text: the parsed label, or None for a text whose numbered
+    label is missing or invalid in the response. Returns None if the API could not be called.
     """
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    
-    if not api_key:
+    if _MODEL is None:
         log.warning("GEMINI_API_KEY not found in .env file. Returning 'Neutral' sentiment.")
-        return "Neutral"
+        return None
 
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
-        prompt = f"""
-        Analyze the sentiment of the following financial news headline.
-        Classify it as 'Positive', 'Negative', or 'Neutral'.
-        Return only the single word classification.
-
-        Headline: "{text}"
-        """
+        numbered_headlines = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(texts))
+        prompt = _PROMPT_FMT % (len(texts), len(texts), numbered_headlines)
         
         # --- Logging the request ---
         log.info("--- Calling Gemini API ---")
-        log.info(f"Model: gemini-flash-latest")
-        log.info(f"Request Body (Prompt):\n{prompt}")
+        log.info("Model: %s", MODEL_NAME)
+        if log.isEnabledFor(logging.INFO): # The prompt can be long; skip building the record when INFO is off
+            log.info("Request Body (Prompt):\n%s", prompt)
         
-        response = model.generate_content(prompt)
+        response = _MODEL.generate_content(prompt)
         
         # --- Logging the response ---
-        log.info(f"Response Body (Raw Text): {response.text}")
-        
-        sentiment = response.text.strip().capitalize()
+        log.info("Response Body (Raw Text): %s", response.text)
         
-        if sentiment in ['Positive', 'Negative', 'Neutral']:
-            log.info(f"Final Sentiment: {sentiment}")
-            log.info("--- Gemini API Call End ---")
-            return sentiment
-        else:
-            log.warning(f"Unexpected sentiment format '{sentiment}'. Defaulting to Neutral.")
-            log.info("--- Gemini API Call End ---")
-            return "Neutral"
+        # Map labels by their number ("1. Positive", "2) **Negative**"), so a preamble or
+        # markdown in the reply can't shift labels onto the wrong headlines
+        by_number = {}
+        for match in _LABEL_LINE.finditer(response.text):
+            label = match.group(2).title()
+            if label in VALID_SENTIMENTS:
+                by_number[int(match.group(1))] = label
+        sentiments = [by_number.get(i + 1) for i in range(len(texts))]
+        failed = [i + 1 for i, label in enumerate(sentiments) if label is None]
+        if failed:
+            log.warning("Could not parse a valid label for headline(s) %s from the Gemini response.", failed)
+
+        log.info("Final Sentiments: %s", sentiments)
+        log.info("--- Gemini API Call End ---")
+        return sentiments
             
     except Exception as e:
-        log.error(f"Error during Gemini API call: {e}")
+        log.error("Error during Gemini API call: %s", e)
         log.info("--- Gemini API Call End ---")
-        return "Neutral"
+        return None
+
+def get_sentiments(texts: list[str], default: str | None = "Neutral") -> list[str | None]:
+    """
+    Analyzes the sentiment of several texts with a single Gemini API call.
+    Returns one label per input text, in the same order; a text that could not be
+    classified (API unavailable, or its line of the response unparseable) gets `default`
+    ('Neutral' unless the caller passes e.g. None to detect the fallback).
+    Only labels actually parsed from a response are cached by a hash of the text
+    (in memory and in the database), so a headline that has been classified before
+    never triggers another API call, while 'Neutral' fallbacks are retried next time.
+    """
+    global _sentiment_cache
+    if _sentiment_cache is None:
+        _sentiment_cache = get_sentiment_cache_from_db()
+
+    hashes = [_text_hash(text) for text in texts]
+
+    # Only send each distinct uncached headline once
+    misses = {h: text for h, text in zip(hashes, texts) if h not in _sentiment_cache}
+    if misses:
+        log.info("Sentiment cache: %d hits, %d misses.", sum(h not in misses for h in hashes), len(misses))
+        labels = _classify_with_gemini(list(misses.values()))
+        # Only labels that parsed are cached; headlines that failed (None) get the `default`
+        # fallback below without being cached, so they are retried on the next call
+        if labels is not None:
+            new_entries = {h: label for h, label in zip(misses.keys(), labels) if label is not None}
+            if new_entries:
+                _sentiment_cache.update(new_entries)
+                save_sentiments_to_db(new_entries)
+
+    return [_sentiment_cache.get(h, default) for h in hashes]
+
+def get_sentiment(text: str) -> str:
+    """
+    Analyzes the sentiment of a given text using the Gemini API.
+    """
+    return get_sentiments([text])[0]
 
 if __name__ == '__main__':
     # Example Usage:
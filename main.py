@@ -1,3 +1,7 @@
+# 导入 functools 库, 其中的 lru_cache 装饰器用于缓存函数结果
+import functools
+# 导入 io 库, 用于在内存中保存编码后的图表(PNG)
+import io
 # 导入 matplotlib.pyplot 库, 这是Python中用于绘图的主要库, 通常简写为 plt
 # 作用类似于Java中的JFreeChart或前端的D3.js, Chart.js
 import matplotlib.pyplot as plt
@@ -17,17 +21,14 @@ from strategies.sma_crossover import generate_signals
 # 从 backtest 目录的 engine.py 文件中导入 run_backtest 函数
 from backtest.engine import run_backtest
 
-# --- 定义绘图函数 ---
-# def 是 Python 中定义函数的关键字
-# portfolio: 'pd.DataFrame' 是类型提示(type hint), 表示 portfolio 参数期望是 pandas DataFrame 类型。这对代码可读性有好处, 但Python解释器本身不强制要求。
-# 这类似于 TypeScript 中的 `function plot_results(portfolio: pd.DataFrame, ...)`
-def plot_results(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str, company_name: str = None):
+# --- 加载中文字体 ---
+# @functools.lru_cache 会缓存函数的返回值, 所以字体只在第一次调用时加载, 之后直接复用
+# 这类似于 Java 中的单例(Singleton)或延迟初始化(lazy initialization)
+@functools.lru_cache(maxsize=1)
+def _get_fonts():
     """
-    这是一个函数文档字符串(docstring), 用来解释函数的作用。
-    功能: 绘制回测结果图表, 标签同时支持中英文。
-    这个版本直接从文件路径加载字体, 以修复可能的编码问题。
+    加载图表使用的中文字体, 返回 (chinese_font, title_font)。
     """
-    # --- 加载中文字体 ---
     # `try...except` 块用于异常处理, 类似于 Java/JavaScript 中的 `try...catch`
     try:
         # 定义中文字体(SimHei)在Windows系统中的常见路径
@@ -42,20 +43,48 @@ def plot_results(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str
         # 如果找不到指定的字体, 则回退到默认字体, 这可能导致中文显示为方框
         chinese_font = FontProperties(size=12)
         title_font = FontProperties(size=18)
+    return chinese_font, title_font
+
+# 标记图表样式是否已经应用, 避免每次绘图都重新解析样式文件
+_STYLE_APPLIED = False
+
+def _apply_style():
+    """
+    设置图表使用的样式/主题, 只在第一次调用时生效。
+    """
+    # `global` 关键字表示要修改的是模块级变量, 而不是创建一个局部变量
+    global _STYLE_APPLIED
+    if not _STYLE_APPLIED:
+        # 'seaborn-v0_8-darkgrid' 是一个深色网格背景的主题
+        style.use('seaborn-v0_8-darkgrid')
+        _STYLE_APPLIED = True
+
+# --- 定义绘图函数 ---
+# def 是 Python 中定义函数的关键字
+# portfolio: 'pd.DataFrame' 是类型提示(type hint), 表示 portfolio 参数期望是 pandas DataFrame 类型。这对代码可读性有好处, 但Python解释器本身不强制要求。
+# 这类似于 TypeScript 中的 `function plot_results(portfolio: pd.DataFrame, ...)`
+def plot_results(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str, company_name: str = None):
+    """
+    这是一个函数文档字符串(docstring), 用来解释函数的作用。
+    功能: 绘制回测结果图表, 标签同时支持中英文。
+    这个版本直接从文件路径加载字体, 以修复可能的编码问题。
+    """
+    # 获取缓存的字体(只在第一次调用时加载), 并确保图表样式已经应用
+    chinese_font, title_font = _get_fonts()
+    _apply_style()
 
-    # 设置图表使用的样式/主题, 'seaborn-v0_8-darkgrid' 是一个深色网格背景的主题
-    style.use('seaborn-v0_8-darkgrid')
-    
     # 创建一个包含两个子图(ax1, ax2)的图表(fig)
     # plt.subplots(2, 1, ...) 表示创建一个2行1列的网格布局
     # figsize=(14, 12) 设置整个图表的尺寸(宽14英寸, 高12英寸)
     # gridspec_kw={'height_ratios': [3, 1]} 指定上下两个子图的高度比例为3:1
     # sharex=True 表示两个子图共享同一个X轴(即日期轴), 这样缩放或平移时会同步
+    # constrained_layout=True 在绘制时自动排布子图和标题(包括主标题), 防止标签重叠, 无需再调用 tight_layout
     fig, (ax1, ax2) = plt.subplots(
         2, 1, 
         figsize=(14, 12), 
         gridspec_kw={'height_ratios': [3, 1]},
-        sharex=True
+        sharex=True,
+        constrained_layout=True
     )
     # 为整个图表设置主标题
     # f'...' 是Python的f-string格式化字符串, 类似于JavaScript的模板字符串 `${}`
@@ -71,26 +100,28 @@ def plot_results(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str
     # --- 第一个子图 (ax1): 绘制股价, 均线和买卖信号 ---
     # ax1.plot(...) 是在第一个子图上绘线
     # signals.index 是X轴数据(日期), signals['Close'] 是Y轴数据(收盘价)
-    ax1.plot(signals.index, signals['Close'], label='Close Price / 收盘价', color='skyblue', linewidth=1.5)
-    ax1.plot(signals.index, signals['short_mavg'], label='Short SMA / 短期均线', color='orange', linestyle='--', linewidth=1.2)
-    ax1.plot(signals.index, signals['long_mavg'], label='Long SMA / 长期均线', color='purple', linestyle='--', linewidth=1.2)
+    # rasterized=True 让这些数据点很多的线条以位图形式绘制, 坐标轴和文字仍保持矢量格式
+    ax1.plot(signals.index, signals['Close'], label='Close Price / 收盘价', color='skyblue', linewidth=1.5, rasterized=True)
+    ax1.plot(signals.index, signals['short_mavg'], label='Short SMA / 短期均线', color='orange', linestyle='--', linewidth=1.2, rasterized=True)
+    ax1.plot(signals.index, signals['long_mavg'], label='Long SMA / 长期均线', color='purple', linestyle='--', linewidth=1.2, rasterized=True)
     
     # 从信号数据中筛选出所有买入信号的行
     # signals['positions'] == 1.0 是一个条件, 返回一个布尔值的序列
     # signals[...] 使用这个布尔序列来过滤DataFrame, 只保留值为True的行
     buy_signals = signals[signals['positions'] == 1.0]
-    # 在图上标记买入点。这里不在是画线, 而是画标记(marker)
-    # '^' 表示使用向上的三角形作为标记
-    # markersize=10 设置标记的大小, color='g' 设置为绿色
-    ax1.plot(buy_signals.index, signals['short_mavg'][buy_signals.index],
-             '^', markersize=10, color='g', lw=0, label='Buy Signal / 买入信号')
+    # 在图上标记买入点。这里不在是画线, 而是用 scatter 一次性画出所有标记(marker)
+    # buy_signals 已经包含 short_mavg 列, 无需再按日期到 signals 中查找
+    # marker='^' 表示使用向上的三角形作为标记
+    # s=100 设置标记的面积(相当于 markersize=10), c='g' 设置为绿色
+    ax1.scatter(buy_signals.index, buy_signals['short_mavg'],
+                marker='^', s=100, c='g', label='Buy Signal / 买入信号')
 
     # 筛选出所有卖出信号的行
     sell_signals = signals[signals['positions'] == -1.0]
     # 在图上标记卖出点
-    # 'v' 表示使用向下的三角形作为标记, color='r' 设置为红色
-    ax1.plot(sell_signals.index, signals['short_mavg'][sell_signals.index],
-             'v', markersize=10, color='r', lw=0, label='Sell Signal / 卖出信号')
+    # marker='v' 表示使用向下的三角形作为标记, c='r' 设置为红色
+    ax1.scatter(sell_signals.index, sell_signals['short_mavg'],
+                marker='v', s=100, c='r', label='Sell Signal / 卖出信号')
 
     # 设置第一个子图的标题和Y轴标签, 并应用中文字体
     ax1.set_title('Stock Price, Moving Averages, and Trading Signals / 股价, 移动均线, 和交易信号', fontproperties=chinese_font)
@@ -102,7 +133,7 @@ def plot_results(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str
 
     # --- 第二个子图 (ax2): 绘制投资组合净值曲线 (资金变化) ---
     # ax2.plot(...) 在第二个子图上绘线
-    ax2.plot(portfolio.index, portfolio['total_value'], label='Portfolio Value / 投资组合价值', color='green', linewidth=1.5)
+    ax2.plot(portfolio.index, portfolio['total_value'], label='Portfolio Value / 投资组合价值', color='green', linewidth=1.5, rasterized=True)
     # 设置第二个子图的标题, X轴和Y轴的标签
     ax2.set_title('Portfolio Equity Curve / 投资组合净值曲线', fontproperties=chinese_font)
     ax2.set_xlabel('Date / 日期', fontproperties=chinese_font)
@@ -111,12 +142,26 @@ def plot_results(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str
     ax2.legend(loc='upper left', prop=chinese_font)
     ax2.grid(True)
     
-    # 自动调整子图参数, 使之填充整个图表区域, 防止标签重叠
-    plt.tight_layout(rect=[0, 0.03, 1, 0.97])
-    
     # 返回创建好的图表对象(fig)。这使得其他函数可以复用这个图表, 比如在Streamlit应用中显示它
     return fig
 
+# --- 渲染图表为 PNG 字节 ---
+# Web应用等需要重复绘图的场景使用此函数: 图表编码为 PNG 后立即关闭, pyplot 不会保留任何 Figure 对象, 内存不会随绘图次数增长
+def render_results_png(portfolio: 'pd.DataFrame', signals: 'pd.DataFrame', ticker: str, company_name: str = None,
+                       dpi: int = 80) -> bytes:
+    """
+    绘制回测结果图表并返回 PNG 字节数据, 编码后立即关闭图表释放内存。
+    较低的 DPI 和较低的 PNG 压缩级别可以显著缩短编码时间。
+    """
+    fig = plot_results(portfolio, signals, ticker, company_name)
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=dpi, pil_kwargs={'compress_level': 1})
+    finally:
+        # 无论编码是否成功都关闭图表, 从 pyplot 的全局注册表中移除
+        plt.close(fig)
+    return buf.getvalue()
+
 # --- 定义主函数 ---
 # 这是程序的逻辑主干
 def main():
@@ -1,13 +1,12 @@
 import streamlit as st
 import pandas as pd
 import json
-import base64
 import sys
 import os
 
 # Add the project root to the Python path to allow for absolute imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from data.database import get_all_reports_from_db
+from data.database import get_report_summaries_from_db, get_chart_image_from_db
 
 st.set_page_config(
     page_title="回测报告查看器 (Backtest Report Viewer)",
@@ -15,6 +14,22 @@ st.set_page_config(
     layout="wide"
 )
 
+# Reports are never modified after they are saved, so the decoded contents can be cached by id.
+# The underscore-prefixed arguments are excluded from Streamlit's cache key.
+@st.cache_data(show_spinner=False)
+def _decode_report(report_id: int, _metrics_json: str, _params_json: str):
+    return json.loads(_metrics_json), json.loads(_params_json)
+
+# The chart is the only large column, so it is fetched per report and only when requested.
+# Only the most recently viewed charts are kept, so memory stays bounded as more reports are opened.
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_chart(report_id: int):
+    chart_image = get_chart_image_from_db(report_id)
+    if chart_image is None or isinstance(chart_image, bytes):
+        return chart_image
+    # Older reports stored the chart as a base64 string
+    return f"data:image/png;base64,{chart_image}"
+
 st.title("📜 回测报告查看器 (Backtest Report Viewer)")
 
 if st.button("🔄 刷新报告 (Refresh Reports)"):
@@ -23,20 +38,19 @@ if st.button("🔄 刷新报告 (Refresh Reports)"):
 st.info("这里展示了所有已保存的回测运行记录。点击展开查看详情。")
 
 # --- Load Reports ---
-reports_df = get_all_reports_from_db()
+reports_df = get_report_summaries_from_db()
 
 if reports_df.empty:
     st.warning("数据库中没有找到任何回测报告。请返回主页运行一次新的回测。")
 else:
     # --- Display Reports ---
-    for index, row in reports_df.iterrows():
+    for row in reports_df.itertuples(index=False):
         st.divider()
         
         # --- Summary View (in a collapsible expander) ---
-        metrics = json.loads(row['performance_metrics'])
-        params = json.loads(row['strategy_params'])
+        metrics, params = _decode_report(row.id, row.performance_metrics, row.strategy_params)
         
-        summary_header = f"**{row['company_name']} ({row['ticker']})** - 回测于 {row['run_timestamp']}"
+        summary_header = f"**{row.company_name} ({row.ticker})** - 回测于 {row.run_timestamp}"
         
         with st.expander(summary_header):
             st.write("#### 核心性能指标 (Key Performance Metrics)")
@@ -50,7 +64,13 @@ else:
 
             # --- Detailed View ---
             st.write("#### 回测图表 (Backtest Chart)")
-            st.image(f"data:image/png;base64,{row['chart_image']}", use_column_width=True)
+            # Streamlit runs the expander body even while collapsed, so the chart is loaded on demand
+            if st.checkbox("显示图表 (Show Chart)", key=f"show_chart_{row.id}"):
+                chart_image = _load_chart(row.id)
+                if chart_image is not None:
+                    st.image(chart_image, use_container_width=True)
+                else:
+                    st.warning("未找到该报告的图表。")
 
             tab1, tab2 = st.tabs(["所有性能指标 (All Metrics)", "策略参数 (Strategy Parameters)"])
             
@@ -0,0 +1,115 @@
+import numpy as np
+import sys
+import os
+
+# Add the project root to the Python path to allow for absolute imports
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from numba_compat import njit
+
+@njit(cache=True)
+def _add_value(val, nobs, sum_x, comp, same_ct, prev):
+    # Kahan-compensated add; also tracks a run of identical values like pandas does
+    if not np.isnan(val):
+        nobs += 1
+        y = val - comp
+        t = sum_x + y
+        comp = t - sum_x - y
+        sum_x = t
+        same_ct = same_ct + 1 if val == prev else 1
+        prev = val
+    return nobs, sum_x, comp, same_ct, prev
+
+@njit(cache=True)
+def _remove_value(val, nobs, sum_x, comp):
+    if not np.isnan(val):
+        nobs -= 1
+        y = -val - comp
+        t = sum_x + y
+        comp = t - sum_x - y
+        sum_x = t
+    return nobs, sum_x, comp
+
+@njit(cache=True)
+def _window_mean(nobs, sum_x, same_ct, prev):
+    if nobs == 0:
+        return np.nan
+    if same_ct >= nobs: # Every value in the window is identical, so return it exactly
+        return prev
+    return sum_x / nobs
+
+@njit(cache=True)
+def sma_signals(close: np.ndarray, short_window: int, long_window: int):
+    """
+    Computes both moving averages, the crossover signal and the position changes
+    in one fused pass, using running sums over the sliding windows.
+    Matches pandas `rolling(window, min_periods=1).mean()` within floating-point
+    tolerance (NaN prices are skipped), a signal of 0 for the first `short_window`
+    rows and `signal.diff()`. The running sums follow pandas' own update order so
+    that exact ties between the averages resolve the same way; run this module
+    to check against the pandas reference.
+
+    Args:
+        close (np.ndarray): float64 array of close prices.
+        short_window (int): Period of the short moving average.
+        long_window (int): Period of the long moving average.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: short_mavg,
+        long_mavg, signal and positions arrays.
+    """
+    n = close.shape[0]
+    short_mavg = np.empty(n, dtype=np.float64)
+    long_mavg = np.empty(n, dtype=np.float64)
+    signal = np.zeros(n, dtype=np.float64)
+    positions = np.empty(n, dtype=np.float64)
+
+    # Like pandas, adds and removes keep separate Kahan compensation terms
+    nobs_s, sum_s, add_s, rem_s, same_s, prev_s = 0, 0.0, 0.0, 0.0, 0, np.nan
+    nobs_l, sum_l, add_l, rem_l, same_l, prev_l = 0, 0.0, 0.0, 0.0, 0, np.nan
+    for i in range(n):
+        # Drop the price that just left each window, then add the new one
+        if i >= short_window:
+            nobs_s, sum_s, rem_s = _remove_value(close[i - short_window], nobs_s, sum_s, rem_s)
+        if i >= long_window:
+            nobs_l, sum_l, rem_l = _remove_value(close[i - long_window], nobs_l, sum_l, rem_l)
+        nobs_s, sum_s, add_s, same_s, prev_s = _add_value(close[i], nobs_s, sum_s, add_s, same_s, prev_s)
+        nobs_l, sum_l, add_l, same_l, prev_l = _add_value(close[i], nobs_l, sum_l, add_l, same_l, prev_l)
+
+        short_mavg[i] = _window_mean(nobs_s, sum_s, same_s, prev_s)
+        long_mavg[i] = _window_mean(nobs_l, sum_l, same_l, prev_l)
+
+        if i >= short_window and short_mavg[i] > long_mavg[i]:
+            signal[i] = 1.0
+        positions[i] = signal[i] - signal[i - 1] if i > 0 else np.nan
+
+    return short_mavg, long_mavg, signal, positions
+
+
+if __name__ == '__main__':
+    # Regression check against the pandas reference, including prices rounded to cents
+    # and repeating patterns, where the two averages are often exactly equal
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    cases = [np.tile(rng.uniform(10, 200, p).round(2), 200) for p in (2, 3, 4, 5)]
+    cases += [(100 + rng.normal(0, 1, 1000).cumsum()).round(2) for _ in range(20)]
+    cases += [np.full(300, 50.0), np.repeat([10.0, 20.0, 15.0], 100)]
+    gapped = 100 + rng.normal(0, 1, 1000).cumsum()
+    gapped[rng.integers(0, 1000, 30)] = np.nan
+    cases.append(gapped)
+
+    for close in cases:
+        for short_window, long_window in [(2, 4), (3, 6), (5, 20), (10, 20), (20, 60), (40, 100)]:
+            s = pd.Series(close)
+            short_ref = s.rolling(short_window, min_periods=1).mean().to_numpy()
+            long_ref = s.rolling(long_window, min_periods=1).mean().to_numpy()
+            signal_ref = np.zeros(len(close))
+            signal_ref[short_window:] = np.where(short_ref[short_window:] > long_ref[short_window:], 1.0, 0.0)
+            positions_ref = pd.Series(signal_ref).diff().to_numpy()
+
+            short_mavg, long_mavg, signal, positions = sma_signals(close, short_window, long_window)
+            np.testing.assert_allclose(short_mavg, short_ref, rtol=1e-12, equal_nan=True)
+            np.testing.assert_allclose(long_mavg, long_ref, rtol=1e-12, equal_nan=True)
+            np.testing.assert_array_equal(signal, signal_ref)
+            np.testing.assert_array_equal(positions, positions_ref)
+    print(f"sma_signals matches pandas on {len(cases)} price series.")
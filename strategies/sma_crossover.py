@@ -1,8 +1,9 @@
 import pandas as pd
 import numpy as np
 import pandas_ta as ta # 导入 pandas_ta 库用于计算技术指标
-from llm.gemini_service import get_sentiment # 导入新的服务
+from llm.gemini_service import get_sentiments # 导入新的服务
 from logger_config import log # 导入集中的日志记录器
+from strategies._sma_loop import sma_signals
 
 # --- Mock News Headlines ---
 # In a real-world scenario, you would fetch these from a news API
@@ -14,6 +15,9 @@ mock_news = {
     '2021-05-10': "AAPL announces 100 billion dollar stock buyback program.", # Positive
     '2021-05-24': "Reports of production cuts for iPhone 14 surface amid demand fears.", # Negative
 }
+# Date-keyed Series built once, so headlines can be aligned to price data with a single reindex
+_NEWS_SERIES = pd.Series(mock_news)
+_NEWS_SERIES.index = pd.to_datetime(_NEWS_SERIES.index)
 
 def generate_signals(data: pd.DataFrame, short_window: int, long_window: int, adx_threshold: int = 25) -> pd.DataFrame:
     """
@@ -31,47 +35,64 @@ def generate_signals(data: pd.DataFrame, short_window: int, long_window: int, ad
     if short_window >= long_window:
         raise ValueError("Short window must be smaller than long window.")
 
-    signals = data.copy()
-    signals['short_mavg'] = signals['Close'].rolling(window=short_window, min_periods=1).mean()
-    signals['long_mavg'] = signals['Close'].rolling(window=long_window, min_periods=1).mean()
+    # Shallow copy: the new columns are added to this frame only, the input's price columns are shared, not duplicated
+    signals = data.copy(deep=False)
+    # Moving averages, crossover signal and position changes in one compiled pass
+    short_mavg, long_mavg, signal, positions = sma_signals(
+        signals['Close'].to_numpy(np.float64), short_window, long_window
+    )
+    signals['short_mavg'] = short_mavg
+    signals['long_mavg'] = long_mavg
 
-    # Calculate ADX (计算ADX指标)
-    # ADX通常需要 'High', 'Low', 'Close' 列
-    adx = ta.adx(signals['High'], signals['Low'], signals['Close'], append=True)
-    signals['ADX'] = adx[f'ADX_14'] # 默认周期为14，取ADX值
+    # A signal is 1 while the short moving average is above the long one; positions are its changes
+    signals['signal'] = signal
+    signals['positions'] = positions
 
-    # Create a signal when the short moving average crosses the long moving average
-    signals['signal'] = 0.0
-    signals.loc[signals.index[short_window:], 'signal'] = np.where(
-        signals['short_mavg'][short_window:] > signals['long_mavg'][short_window:], 1.0, 0.0
-    )
+    # Add mock news to the dataframe: one datetime64 join against the date-keyed Series, no per-row strings
+    signals['headlines'] = _NEWS_SERIES.reindex(signals.index.normalize()).to_numpy()
+    # Set when a headline could not be classified and was treated as Neutral, so callers can avoid caching the result
+    signals.attrs['sentiment_fallback'] = False
 
-    # Generate trading orders by taking the difference of the signal
-    signals['positions'] = signals['signal'].diff()
+    # Without any crossover there is nothing for the ADX or sentiment filters to cancel, so skip both
+    # (没有任何交叉信号时, 跳过ADX和情感分析计算)
+    if not np.any(positions[1:] != 0.0):
+        signals['ADX'] = np.nan
+        log.info("No crossover signals found; skipping ADX and sentiment filters.")
+        return signals
+
+    # Calculate ADX (计算ADX指标)
+    # ADX通常需要 'High', 'Low', 'Close' 列
+    # pandas_ta 在数据行数少于ADX周期时返回 None, 此时没有可用的ADX值
+    # 只保留 ADX 列, 不把 DMP_14/DMN_14 附加到 signals 中
+    adx = ta.adx(signals['High'], signals['Low'], signals['Close'], append=False)
+    signals['ADX'] = adx['ADX_14'].to_numpy() if adx is not None else np.nan # 默认周期为14，取ADX值
 
     # --- ADX Trend Filter (ADX趋势过滤器) ---
     # 如果ADX低于阈值，则将交易信号置为0，避免在盘整市场中交易
     signals.loc[signals['ADX'] < adx_threshold, 'positions'] = 0.0
-    log.info(f"ADX filter applied with threshold: {adx_threshold}.")
+    log.info("ADX filter applied with threshold: %s.", adx_threshold)
 
     # --- LLM Integration ---
-    # Add mock news to the dataframe
-    signals['headlines'] = signals.index.strftime('%Y-%m-%d').map(mock_news)
-
     # Identify rows where a buy signal and a headline co-occur
     buy_signals_with_news = signals[(signals['positions'] == 1.0) & (signals['headlines'].notna())].index
 
-    # Apply sentiment filter only on these specific rows
-    for idx in buy_signals_with_news:
-        headline = signals.loc[idx, 'headlines']
-        log.info(f"Analyzing news for {idx.date()}: '{headline}'")
-        sentiment = get_sentiment(headline)
-        log.info(f"Sentiment for {idx.date()}: {sentiment}")
+    # Apply sentiment filter only on these specific rows, classifying all headlines in one batched call
+    if len(buy_signals_with_news) > 0:
+        headlines_list = signals.loc[buy_signals_with_news, 'headlines'].tolist()
+        log.info("Analyzing news for %d buy signals.", len(headlines_list))
+        # default=None marks headlines that could not be classified; they don't cancel a signal (treated as Neutral)
+        labels = get_sentiments(headlines_list, default=None)
+        sentiments = np.array(labels, dtype=object)
+        unclassified = labels.count(None)
+        if unclassified:
+            log.warning("%d headline(s) could not be classified; treating them as Neutral.", unclassified)
+            signals.attrs['sentiment_fallback'] = True
 
         # If sentiment is negative, cancel the buy signal
-        if sentiment == 'Negative':
-            signals.loc[idx, 'positions'] = 0.0
-            log.info(f"-> Negative sentiment detected. Suppressing BUY signal for {idx.date()}.")
+        neg_idx = buy_signals_with_news[sentiments == 'Negative']
+        signals.loc[neg_idx, 'positions'] = 0.0
+        for idx in neg_idx:
+            log.info("-> Negative sentiment detected. Suppressing BUY signal for %s.", idx.date())
 
     log.info("Successfully generated trading signals with sentiment analysis.")
     return signals